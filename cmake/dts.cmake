@@ -21,6 +21,80 @@ set(dts_files
   ${shield_dts_files}
   )
 
+# Run dtc and extract_dts_includes.py on ${BOARD}.dts.pre.tmp, and store the
+# results in the DTS cache entry if there is one.
+macro(zephyr_dts_generate)
+  # Run the DTC on *.dts.pre.tmp to create the intermediary file *.dts_compiled
+
+  set(DTC_WARN_UNIT_ADDR_IF_ENABLED "")
+  check_dtc_flag("-Wunique_unit_address_if_enabled" check)
+  if (check)
+    set(DTC_WARN_UNIT_ADDR_IF_ENABLED "-Wunique_unit_address_if_enabled")
+  endif()
+  set(DTC_NO_WARN_UNIT_ADDR "")
+  check_dtc_flag("-Wno-unique_unit_address" check)
+  if (check)
+    set(DTC_NO_WARN_UNIT_ADDR "-Wno-unique_unit_address")
+  endif()
+  execute_process(
+    COMMAND ${DTC}
+    -O dts
+    -o ${BOARD}.dts_compiled
+    -b 0
+    -E unit_address_vs_reg
+    ${DTC_NO_WARN_UNIT_ADDR}
+    ${DTC_WARN_UNIT_ADDR_IF_ENABLED}
+    ${EXTRA_DTC_FLAGS} # User settable
+    ${BOARD}.dts.pre.tmp
+    WORKING_DIRECTORY ${PROJECT_BINARY_DIR}
+    RESULT_VARIABLE ret
+    )
+  if(NOT "${ret}" STREQUAL "0")
+    message(FATAL_ERROR "command failed with return code: ${ret}")
+  endif()
+
+  if(NOT EXISTS ${DTS_APP_BINDINGS})
+    set(DTS_APP_BINDINGS)
+  endif()
+
+  set(CMD_EXTRACT_DTS_INCLUDES ${PYTHON_EXECUTABLE} ${ZEPHYR_BASE}/scripts/dts/extract_dts_includes.py
+    --dts ${BOARD}.dts_compiled
+    --yaml ${ZEPHYR_BASE}/dts/bindings ${DTS_APP_BINDINGS}
+    --keyvalue ${GENERATED_DTS_BOARD_CONF}
+    --include ${GENERATED_DTS_BOARD_UNFIXED_H}
+    --old-alias-names
+    )
+
+  # Run extract_dts_includes.py to create a .conf and a header file that can be
+  # included into the CMake namespace
+  execute_process(
+    COMMAND ${CMD_EXTRACT_DTS_INCLUDES}
+    WORKING_DIRECTORY ${PROJECT_BINARY_DIR}
+    RESULT_VARIABLE ret
+    )
+  if(NOT "${ret}" STREQUAL "0")
+    message(FATAL_ERROR "command failed with return code: ${ret}")
+  endif()
+
+  if(dts_cache_entry)
+    # Populate the entry through renames so that concurrent builds never
+    # see a partial entry, the .conf file marks it as complete.
+    string(RANDOM LENGTH 8 dts_cache_tmp)
+    set(dts_cache_tmp ${dts_cache_entry}.tmp.${dts_cache_tmp})
+    file(MAKE_DIRECTORY ${dts_cache_entry})
+    file(COPY
+      ${PROJECT_BINARY_DIR}/${BOARD}.dts_compiled
+      ${GENERATED_DTS_BOARD_UNFIXED_H}
+      ${GENERATED_DTS_BOARD_CONF}
+      DESTINATION ${dts_cache_tmp}
+      )
+    foreach(f ${BOARD}.dts_compiled generated_dts_board_unfixed.h generated_dts_board.conf)
+      file(RENAME ${dts_cache_tmp}/${f} ${dts_cache_entry}/${f})
+    endforeach()
+    file(REMOVE_RECURSE ${dts_cache_tmp})
+  endif()
+endmacro()
+
 if(CONFIG_HAS_DTS)
 
   if(DTC_OVERLAY_FILE)
@@ -85,56 +159,41 @@ if(CONFIG_HAS_DTS)
     message(FATAL_ERROR "command failed with return code: ${ret}")
   endif()
 
-  # Run the DTC on *.dts.pre.tmp to create the intermediary file *.dts_compiled
-
-  set(DTC_WARN_UNIT_ADDR_IF_ENABLED "")
-  check_dtc_flag("-Wunique_unit_address_if_enabled" check)
-  if (check)
-    set(DTC_WARN_UNIT_ADDR_IF_ENABLED "-Wunique_unit_address_if_enabled")
-  endif()
-  set(DTC_NO_WARN_UNIT_ADDR "")
-  check_dtc_flag("-Wno-unique_unit_address" check)
-  if (check)
-    set(DTC_NO_WARN_UNIT_ADDR "-Wno-unique_unit_address")
-  endif()
-  execute_process(
-    COMMAND ${DTC}
-    -O dts
-    -o ${BOARD}.dts_compiled
-    -b 0
-    -E unit_address_vs_reg
-    ${DTC_NO_WARN_UNIT_ADDR}
-    ${DTC_WARN_UNIT_ADDR_IF_ENABLED}
-    ${EXTRA_DTC_FLAGS} # User settable
-    ${BOARD}.dts.pre.tmp
-    WORKING_DIRECTORY ${PROJECT_BINARY_DIR}
-    RESULT_VARIABLE ret
-    )
-  if(NOT "${ret}" STREQUAL "0")
-    message(FATAL_ERROR "command failed with return code: ${ret}")
-  endif()
-
-  if(NOT EXISTS ${DTS_APP_BINDINGS})
-    set(DTS_APP_BINDINGS)
+  # When DTS_CACHE_DIR is set (sanitycheck does this), the outputs of dtc
+  # and extract_dts_includes.py are shared between all builds whose
+  # preprocessed DTS is identical, which is typically every application
+  # built for the same board. Applications with their own bindings are
+  # never cached. The key covers the preprocessed DTS, the bindings and
+  # generator scripts in the tree, and the dtc and python command lines,
+  # so an entry is never reused after any of them changes.
+  unset(dts_cache_entry)
+  if(DTS_CACHE_DIR AND NOT EXISTS ${DTS_APP_BINDINGS})
+    file(SHA256 ${PROJECT_BINARY_DIR}/${BOARD}.dts.pre.tmp dts_pre_hash)
+    file(GLOB_RECURSE dts_cache_inputs
+      ${ZEPHYR_BASE}/dts/bindings/*
+      ${ZEPHYR_BASE}/scripts/dts/*.py
+      )
+    list(SORT dts_cache_inputs)
+    set(dts_cache_key "${dts_pre_hash};${DTC};${EXTRA_DTC_FLAGS};${PYTHON_EXECUTABLE}")
+    foreach(f ${dts_cache_inputs})
+      file(SHA256 ${f} f_hash)
+      file(RELATIVE_PATH f_rel ${ZEPHYR_BASE} ${f})
+      string(APPEND dts_cache_key ";${f_rel}=${f_hash}")
+    endforeach()
+    string(SHA256 dts_cache_key "${dts_cache_key}")
+    set(dts_cache_entry ${DTS_CACHE_DIR}/${BOARD}/${dts_cache_key})
   endif()
 
-  set(CMD_EXTRACT_DTS_INCLUDES ${PYTHON_EXECUTABLE} ${ZEPHYR_BASE}/scripts/dts/extract_dts_includes.py
-    --dts ${BOARD}.dts_compiled
-    --yaml ${ZEPHYR_BASE}/dts/bindings ${DTS_APP_BINDINGS}
-    --keyvalue ${GENERATED_DTS_BOARD_CONF}
-    --include ${GENERATED_DTS_BOARD_UNFIXED_H}
-    --old-alias-names
-    )
-
-  # Run extract_dts_includes.py to create a .conf and a header file that can be
-  # included into the CMake namespace
-  execute_process(
-    COMMAND ${CMD_EXTRACT_DTS_INCLUDES}
-    WORKING_DIRECTORY ${PROJECT_BINARY_DIR}
-    RESULT_VARIABLE ret
-    )
-  if(NOT "${ret}" STREQUAL "0")
-    message(FATAL_ERROR "command failed with return code: ${ret}")
+  if(dts_cache_entry AND EXISTS ${dts_cache_entry}/generated_dts_board.conf)
+    message(STATUS "Using cached DTS output from ${dts_cache_entry}")
+    configure_file(${dts_cache_entry}/${BOARD}.dts_compiled
+      ${PROJECT_BINARY_DIR}/${BOARD}.dts_compiled COPYONLY)
+    configure_file(${dts_cache_entry}/generated_dts_board_unfixed.h
+      ${GENERATED_DTS_BOARD_UNFIXED_H} COPYONLY)
+    configure_file(${dts_cache_entry}/generated_dts_board.conf
+      ${GENERATED_DTS_BOARD_CONF} COPYONLY)
+  else()
+    zephyr_dts_generate()
   endif()
 
   import_kconfig(CONFIG_ ${GENERATED_DTS_BOARD_CONF})
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+#
+# SPDX-License-Identifier: Apache-2.0
+#
+# Line oriented reading of the console output of test programs
+
+import codecs
+import heapq
+import itertools
+import os
+import selectors
+import sys
+import threading
+import time
+import traceback
+
+
+class LineReader:
+    """Reads a file descriptor in chunks and splits the data into lines
+
+    The data is decoded as UTF-8 incrementally, so multibyte characters may
+    be split across reads. Every read() consumes whatever is available (up
+    to chunk_size bytes), it only blocks if nothing is.
+    """
+
+    def __init__(self, fd, chunk_size=4096, errors="strict"):
+        """Constructor
+
+        @param fd File descriptor to read from
+        @param chunk_size Maximum number of bytes consumed by one read()
+        @param errors Handling of invalid UTF-8, as for bytes.decode()
+        """
+        self.fd = fd
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors)
+        self.partial = []
+        # Set once the stream can't be read any further: "unexpected eof"
+        # or "unexpected byte" (invalid UTF-8)
+        self.state = None
+
+    def read(self):
+        """Read the next chunk
+
+        @return List of the lines completed by this chunk, each one with its
+            trailing newline. On an error, the lines before the offending
+            data are still returned and state is set. At the end of the
+            stream, an unterminated last line is returned without newline.
+        """
+        try:
+            data = os.read(self.fd, self.chunk_size)
+        except BlockingIOError:
+            return []
+        if not data:
+            self.state = "unexpected eof"
+            try:
+                self.partial.append(self.decoder.decode(b"", final=True))
+            except UnicodeDecodeError:
+                # Truncated multibyte character, keep what came before it
+                pass
+            line = "".join(self.partial)
+            self.partial = []
+            return [line] if line else []
+
+        lines = []
+        start = 0
+        while start < len(data):
+            end = data.find(b"\n", start)
+            end = len(data) if end < 0 else end + 1
+            try:
+                self.partial.append(self.decoder.decode(data[start:end]))
+            except UnicodeDecodeError:
+                self.state = "unexpected byte"
+                break
+            if data[end - 1:end] == b"\n":
+                lines.append("".join(self.partial))
+                self.partial = []
+            start = end
+        return lines
+
+
+class Watch:
+    """Console output of one test being monitored by a ConsoleLoop"""
+
+    def __init__(self, fd, on_lines, on_done, errors):
+        self.reader = LineReader(fd, errors=errors)
+        self.on_lines = on_lines
+        self.on_done = on_done
+        self.deadline = None
+        self.finished = False
+
+
+class ConsoleLoop:
+    """Single thread multiplexing the console output of all running tests
+
+    Every watched file descriptor gets its lines passed to a callback as
+    soon as they are complete and its deadline enforced through a heap of
+    timers, so the overhead doesn't grow with the number of tests running
+    at once. The callbacks run in the loop thread and must not block.
+    """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.timers = []
+        self.seq = itertools.count()
+        # Reentrant, so that the callbacks can call set_timeout()
+        self.lock = threading.RLock()
+        self.thread = None
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        os.set_blocking(self.wakeup_r, False)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+
+    def add(self, fd, on_lines, on_done, timeout=None, errors="strict"):
+        """Start watching a file descriptor
+
+        @param fd File descriptor to read the console output from, it's
+            switched to non-blocking mode
+        @param on_lines Called with the list of lines read by each chunk,
+            returns True once it doesn't need any further output
+        @param on_done Called once with the reason the watch ended: "done"
+            (on_lines returned True), "timeout", "unexpected eof",
+            "unexpected byte", "callback error" (on_lines raised an
+            exception) or "cancelled"
+        @param timeout Seconds from now after which the watch ends, None
+            to wait until set_timeout() is called
+        @param errors Handling of invalid UTF-8, as for bytes.decode()
+        @return Watch object
+        """
+        os.set_blocking(fd, False)
+        watch = Watch(fd, on_lines, on_done, errors)
+        with self.lock:
+            if not self.thread:
+                self.thread = threading.Thread(name="console",
+                                               target=self._loop)
+                self.thread.daemon = True
+                self.thread.start()
+            self.selector.register(fd, selectors.EVENT_READ, watch)
+            self._set_timeout(watch, timeout)
+        self._wakeup()
+        return watch
+
+    def _set_timeout(self, watch, timeout):
+        if timeout is None:
+            watch.deadline = None
+            return
+        watch.deadline = time.time() + timeout
+        heapq.heappush(self.timers, (watch.deadline, next(self.seq), watch))
+
+    def set_timeout(self, watch, timeout):
+        """Change the deadline of a watch to timeout seconds from now"""
+        with self.lock:
+            self._set_timeout(watch, timeout)
+        self._wakeup()
+
+    def cancel(self, watch):
+        """End a watch, on_done gets "cancelled" unless it already ended"""
+        with self.lock:
+            self._finish(watch, "cancelled")
+
+    def _wakeup(self):
+        if threading.current_thread() is not self.thread:
+            os.write(self.wakeup_w, b"x")
+
+    def _finish(self, watch, reason):
+        # Called with the lock held
+        if watch.finished:
+            return
+        watch.finished = True
+        self.selector.unregister(watch.reader.fd)
+        try:
+            watch.on_done(reason)
+        except Exception:
+            # The other watches must keep going
+            traceback.print_exc()
+
+    def _next_timeout(self):
+        # Drop the timers of watches which ended or got a new deadline
+        while self.timers:
+            deadline, _, watch = self.timers[0]
+            if watch.finished or watch.deadline != deadline:
+                heapq.heappop(self.timers)
+            else:
+                return max(deadline - time.time(), 0)
+        return None
+
+    def _loop(self):
+        while True:
+            with self.lock:
+                timeout = self._next_timeout()
+            events = self.selector.select(timeout)
+
+            with self.lock:
+                for key, _ in events:
+                    watch = key.data
+                    if watch is None:
+                        try:
+                            os.read(self.wakeup_r, 4096)
+                        except BlockingIOError:
+                            pass
+                        continue
+                    if watch.finished:
+                        continue
+                    lines = watch.reader.read()
+                    try:
+                        done = lines and watch.on_lines(lines)
+                    except Exception:
+                        traceback.print_exc()
+                        self._finish(watch, "callback error")
+                        continue
+                    if done:
+                        self._finish(watch, "done")
+                    elif watch.reader.state:
+                        self._finish(watch, watch.reader.state)
+
+                now = time.time()
+                while self.timers and self.timers[0][0] <= now:
+                    deadline, _, watch = heapq.heappop(self.timers)
+                    if not watch.finished and watch.deadline == deadline:
+                        self._finish(watch, "timeout")
+
+
+def benchmark(megabytes):
+    """Push megabytes of console output through a FIFO and report the
+    throughput of LineReader, and of the previous byte at a time reader"""
+    import tempfile
+
+    line = b"PROJECT EXECUTION: tick %08d, all good and running \xc2\xb5s\n"
+    count = megabytes * 1024 * 1024 // len(line % 0)
+
+    def produce(fifo):
+        if os.fork() == 0:
+            with open(fifo, "wb") as f:
+                for i in range(count):
+                    f.write(line % i)
+            os._exit(0)
+
+    def read_lines(fifo):
+        fd = os.open(fifo, os.O_RDONLY)
+        reader = LineReader(fd)
+        lines = 0
+        while not reader.state:
+            lines += len(reader.read())
+        os.close(fd)
+        return lines
+
+    def read_bytes(fifo):
+        lines = 0
+        with open(fifo, "rb", buffering=0) as f:
+            line = ""
+            while True:
+                c = f.read(1)
+                if not c:
+                    break
+                # Decode as latin-1, the old reader failed on any multibyte
+                # character
+                line = line + c.decode("latin-1")
+                if c == b"\n":
+                    lines += 1
+                    line = ""
+        return lines
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fifo = os.path.join(tmp, "fifo")
+        os.mkfifo(fifo)
+        for name, fn in [("LineReader", read_lines),
+                         ("byte at a time", read_bytes)]:
+            produce(fifo)
+            start = time.time()
+            lines = fn(fifo)
+            duration = time.time() - start
+            os.wait()
+            print("%-15s %d lines in %.2f seconds (%.1f MB/s)" %
+                  (name, lines, duration, megabytes / duration))
+
+
+def benchmark_loop(instances):
+    """Run instances concurrent producers of console output, each one
+    printing a line every 10 ms for 2 seconds, through a single ConsoleLoop
+    and report the CPU time it used"""
+    loop = ConsoleLoop()
+    done = threading.Semaphore(0)
+    lines = [0]
+
+    def on_lines(l):
+        lines[0] += len(l)
+        return False
+
+    pids = []
+    for i in range(instances):
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            for n in range(200):
+                os.write(w, b"instance %d line %d\n" % (i, n))
+                time.sleep(0.01)
+            os._exit(0)
+        os.close(w)
+        pids.append(pid)
+        loop.add(r, on_lines, lambda reason, r=r: (os.close(r), done.release()),
+                 timeout=60)
+
+    start = time.time()
+    cpu = time.process_time()
+    for pid in pids:
+        os.waitpid(pid, 0)
+    for i in range(instances):
+        done.acquire()
+    cpu = time.process_time() - cpu
+    print("%d instances: %d lines in %.2f seconds, %.2f s CPU in the loop "
+          "(%.1f us/line)" % (instances, lines[0], time.time() - start, cpu,
+                              cpu * 1e6 / lines[0]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 16)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--benchmark-loop":
+        benchmark_loop(int(sys.argv[2]) if len(sys.argv) > 2 else 256)
+    else:
+        print("usage: %s --benchmark [MEGABYTES] | --benchmark-loop "
+              "[INSTANCES]" % sys.argv[0])
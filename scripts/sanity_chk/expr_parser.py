@@ -8,6 +8,7 @@ import sys
 import os
 import copy
 import threading
+import functools
 import re
 
 try:
@@ -169,52 +170,100 @@ if "PARSETAB_DIR" not in os.environ:
 else:
     parser = yacc.yacc(debug=0, outputdir=os.environ["PARSETAB_DIR"])
 
-def ast_sym(ast, env):
-    if ast in env:
-        return str(env[ast])
-    return ""
-
-def ast_sym_int(ast, env):
-    if ast in env:
-        v = env[ast]
-        if v.startswith("0x") or v.startswith("0X"):
-            return int(v, 16)
-        else:
-            return int(v, 10)
-    return 0
-
-def ast_expr(ast, env):
-    if ast[0] == "not":
-        return not ast_expr(ast[1], env)
-    elif ast[0] == "or":
-        return ast_expr(ast[1], env) or ast_expr(ast[2], env)
-    elif ast[0] == "and":
-        return ast_expr(ast[1], env) and ast_expr(ast[2], env)
-    elif ast[0] == "==":
-        return ast_sym(ast[1], env) == ast[2]
-    elif ast[0] == "!=":
-        return ast_sym(ast[1], env) != ast[2]
-    elif ast[0] == ">":
-        return ast_sym_int(ast[1], env) > int(ast[2])
-    elif ast[0] == "<":
-        return ast_sym_int(ast[1], env) < int(ast[2])
-    elif ast[0] == ">=":
-        return ast_sym_int(ast[1], env) >= int(ast[2])
-    elif ast[0] == "<=":
-        return ast_sym_int(ast[1], env) <= int(ast[2])
-    elif ast[0] == "in":
-        return ast_sym(ast[1], env) in ast[2]
-    elif ast[0] == "exists":
-        return True if ast_sym(ast[1], env) else False
-    elif ast[0] == ":":
-        return True if re.compile(ast[2]).match(ast_sym(ast[1], env)) else False
-
 mutex = threading.Lock()
 
-def parse(expr_text, env):
-    """Given a text representation of an expression in our language,
-    use the provided environment to determine whether the expression
-    is true or false"""
+class LayeredEnv:
+    """Read-only view over several dictionaries, used as the environment
+    of an expression without merging the dictionaries into a new one. When
+    a key is defined in several layers the first one wins."""
+
+    def __init__(self, *layers):
+        self.layers = layers
+
+    def get(self, key, default=None):
+        for layer in self.layers:
+            if key in layer:
+                return layer[key]
+        return default
+
+    def __contains__(self, key):
+        for layer in self.layers:
+            if key in layer:
+                return True
+        return False
+
+    def __getitem__(self, key):
+        for layer in self.layers:
+            if key in layer:
+                return layer[key]
+        raise KeyError(key)
+
+def _sym(sym, env):
+    v = env.get(sym)
+    return "" if v is None else str(v)
+
+def _sym_int(sym, env):
+    v = env.get(sym)
+    if v is None:
+        return 0
+    if v.startswith("0x") or v.startswith("0X"):
+        return int(v, 16)
+    return int(v, 10)
+
+def _compile_ast(ast):
+    """Turn an AST into a function of the environment, so that the node
+    types are only dispatched on once"""
+    op = ast[0]
+    if op == "not":
+        arg = _compile_ast(ast[1])
+        return lambda env: not arg(env)
+    elif op == "or":
+        left = _compile_ast(ast[1])
+        right = _compile_ast(ast[2])
+        return lambda env: left(env) or right(env)
+    elif op == "and":
+        left = _compile_ast(ast[1])
+        right = _compile_ast(ast[2])
+        return lambda env: left(env) and right(env)
+
+    sym = ast[1]
+    if op == "==":
+        value = ast[2]
+        return lambda env: _sym(sym, env) == value
+    elif op == "!=":
+        value = ast[2]
+        return lambda env: _sym(sym, env) != value
+    elif op == ">":
+        value = int(ast[2])
+        return lambda env: _sym_int(sym, env) > value
+    elif op == "<":
+        value = int(ast[2])
+        return lambda env: _sym_int(sym, env) < value
+    elif op == ">=":
+        value = int(ast[2])
+        return lambda env: _sym_int(sym, env) >= value
+    elif op == "<=":
+        value = int(ast[2])
+        return lambda env: _sym_int(sym, env) <= value
+    elif op == "in":
+        values = ast[2]
+        return lambda env: _sym(sym, env) in values
+    elif op == "exists":
+        return lambda env: True if _sym(sym, env) else False
+    elif op == ":":
+        regex = re.compile(ast[2])
+        return lambda env: True if regex.match(_sym(sym, env)) else False
+
+    raise SyntaxError("Unknown operator '%s'" % op)
+
+@functools.lru_cache(maxsize=4096)
+def compile_expr(expr_text):
+    """Parse an expression once and return a function that evaluates it
+    against an environment. The environment can be a dictionary or a
+    LayeredEnv.
+
+    Results are cached, so the same filter text is only parsed once per
+    process."""
 
     # Like it's C counterpart, state machine is not thread-safe
     mutex.acquire()
@@ -223,11 +272,44 @@ def parse(expr_text, env):
     finally:
         mutex.release()
 
-    return ast_expr(ast, env)
+    return _compile_ast(ast)
+
+def parse(expr_text, env):
+    """Given a text representation of an expression in our language,
+    use the provided environment to determine whether the expression
+    is true or false"""
+
+    return compile_expr(expr_text)(env)
+
+def benchmark(count):
+    """Evaluate a typical filter expression count times against a layered
+    environment and report the evaluation rate"""
+    import time
+
+    defconfig = {"CONFIG_SOC" : "nrf52832_qfaa", "CONFIG_FLASH_SIZE" : "512",
+                 "CONFIG_SRAM_SIZE" : "0x10000", "CONFIG_GPIO" : "y"}
+    dt_config = {"DT_FLASH_SIZE" : "512"}
+    base = {"ARCH" : "arm", "PLATFORM" : "nrf52_pca10040"}
+    env = LayeredEnv(dt_config, defconfig, dict(os.environ), base)
+
+    expr = ('CONFIG_GPIO and not CONFIG_BOARD_QEMU_X86 and '
+            'CONFIG_SRAM_SIZE >= 32 and CONFIG_SOC : "nrf52.*" and '
+            'ARCH in ["arm", "x86"]')
+
+    start = time.time()
+    for _ in range(count):
+        parse(expr, env)
+    duration = time.time() - start
+    print("%d evaluations in %.2f seconds (%.0f/s)" %
+          (count, duration, count / duration))
 
 # Just some test code
 if __name__ == "__main__":
 
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1000000)
+        sys.exit(0)
+
     local_env = {
         "A" : "1",
         "C" : "foo",
@@ -246,7 +328,3 @@ if __name__ == "__main__":
         print(parser.parse(line))
 
         print(parse(line, local_env))
-
-
-
-
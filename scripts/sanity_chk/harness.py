@@ -26,17 +26,36 @@ class Harness:
             self.repeat = config.get('repeat', 1)
             self.ordered = config.get('ordered', True)
 
+    def handle(self, line):
+        pass
+
+    def handle_many(self, lines):
+        """Handle lines until one of them leaves a state set
+
+        @param lines List of lines of output
+        @return Number of lines handled, the remaining ones need to be
+            passed again once the caller dealt with the state
+        """
+        handle = self.handle
+        for n, line in enumerate(lines, 1):
+            handle(line)
+            if self.state:
+                return n
+        return len(lines)
+
 class Console(Harness):
 
+    def configure(self, instance):
+        super().configure(instance)
+        self.patterns = [(r, re.compile(r)) for r in self.regex]
+
     def handle(self, line):
         if self.type == "one_line":
-            pattern = re.compile(self.regex[0])
-            if pattern.search(line):
+            if self.patterns[0][1].search(line):
                 self.state = "passed"
         elif self.type == "multi_line":
-            for r in self.regex:
-                pattern = re.compile(r)
-                if pattern.search(line) and not r in self.matches:
+            for r, pattern in self.patterns:
+                if not r in self.matches and pattern.search(line):
                     self.matches[r] = line
 
             if len(self.matches) == len(self.regex):
@@ -69,24 +88,38 @@ class Test(Harness):
             "CPU Page Fault"
             ]
 
+    result = re.compile("(PASS|FAIL|SKIP) - (test_)?(.*)")
+    result_prefixes = ("PASS - ", "FAIL - ", "SKIP - ")
+
+    # The result markers and fault strings, found in a single scan. Plain
+    # alternation of literals lets the regex engine skip quickly over the
+    # positions none of them can start at.
+    kinds = dict([(RUN_PASSED, "passed"), (RUN_FAILED, "failed")] +
+                 [(f, "fault") for f in faults])
+    markers = re.compile("|".join(re.escape(m) for m in kinds))
+
     def handle(self, line):
-        result = re.compile("(PASS|FAIL|SKIP) - (test_)?(.*)")
-        match = result.match(line)
-        if match:
+        if line.startswith(self.result_prefixes):
+            match = self.result.match(line)
             name = "{}.{}".format(self.id, match.group(3))
             self.tests[name] = match.group(1)
 
-        if self.RUN_PASSED in line:
+        if not self.markers.search(line):
+            return
+
+        found = set(self.kinds[m] for m in self.markers.findall(line))
+        passed = "passed" in found
+        failed = "failed" in found
+        fault = "fault" in found
+
+        if passed:
             if self.fault:
                 self.state = "failed"
             else:
                 self.state = "passed"
 
-        if self.RUN_FAILED in line:
+        if failed:
             self.state = "failed"
 
-        if self.fail_on_fault:
-            for fault in self.faults:
-                if fault in line:
-                    self.fault = True
-
+        if fault and self.fail_on_fault:
+            self.fault = True
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Loads scripts/sanitycheck as a module for its unit tests
+
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ZEPHYR_BASE = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                           "..", "..", ".."))
+os.environ.setdefault("ZEPHYR_BASE", ZEPHYR_BASE)
+sys.path.insert(0, os.path.join(ZEPHYR_BASE, "scripts"))
+
+
+def load_sanitycheck():
+    path = os.path.join(ZEPHYR_BASE, "scripts", "sanitycheck")
+    loader = importlib.machinery.SourceFileLoader("sanitycheck", path)
+    spec = importlib.util.spec_from_loader("sanitycheck", loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    sys.modules["sanitycheck"] = module
+    return module
+
+
+@pytest.fixture(scope="session")
+def sanitycheck_module():
+    return load_sanitycheck()
+
+
+@pytest.fixture
+def parse_args(sanitycheck_module, monkeypatch):
+    """Set the options of sanitycheck from a list of command line
+    arguments, for the duration of a test"""
+    def parse(args=[]):
+        monkeypatch.setattr(sys, "argv", ["sanitycheck"] + args)
+        monkeypatch.setattr(sanitycheck_module, "options",
+                            sanitycheck_module.parse_arguments(),
+                            raising=False)
+        return sanitycheck_module.options
+    return parse
+
+
+@pytest.fixture
+def sc(sanitycheck_module, parse_args):
+    """The sanitycheck module, with the default options"""
+    parse_args()
+    return sanitycheck_module
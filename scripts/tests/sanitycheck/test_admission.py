@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Tests of the admission control of builds and runs
+
+import threading
+
+
+def test_first_job_always_admitted(sc, monkeypatch):
+    admission = sc.AdmissionControl(max_load=1)
+    monkeypatch.setattr(admission, "pressure", lambda: "load 9.0 > 1.0")
+    held = []
+    admission.admit("build", held.append)
+    admission.admit("run", held.append)
+    assert held == []
+    assert admission.running == {"build": 1, "run": 1}
+
+
+def test_job_held_back_under_pressure(sc, monkeypatch):
+    admission = sc.AdmissionControl(max_load=1)
+    pressure = ["load 9.0 > 1.0"]
+    monkeypatch.setattr(admission, "pressure", lambda: pressure[0])
+    admission.admit("build")
+
+    held = []
+    admitted = threading.Event()
+
+    def second():
+        admission.admit("build", held.append)
+        admitted.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not admitted.wait(0.3)
+    assert held == ["load 9.0 > 1.0"]
+
+    # Admitted as soon as the other build is done
+    admission.done("build")
+    assert admitted.wait(5)
+    thread.join()
+    assert admission.held["build"] == 1
+    assert admission.held_time > 0
+
+
+def test_pressure(sc, monkeypatch):
+    monkeypatch.setattr(sc.os, "getloadavg", lambda: (3.0, 0, 0))
+    monkeypatch.setattr(sc.AdmissionControl, "available_memory",
+                        staticmethod(lambda: 512 << 20))
+    assert sc.AdmissionControl().pressure() is None
+    assert sc.AdmissionControl(max_load=4).pressure() is None
+    assert sc.AdmissionControl(max_load=2).pressure() == "load 3.0 > 2.0"
+    assert sc.AdmissionControl(min_free=1024).pressure() == \
+        "512 MB available < 1024 MB"
+
+
+def test_no_limits_by_default(sc, parse_args):
+    parse_args([])
+    admission = sc.AdmissionControl(sc.options.max_load,
+                                    sc.options.min_free_memory)
+    assert not admission.max_load and not admission.min_free
+    assert admission.pressure() is None
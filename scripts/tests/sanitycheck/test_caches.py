@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Tests of the build, configuration and run caches
+
+import os
+import types
+
+import pytest
+
+
+@pytest.fixture
+def tree(sc, tmp_path, monkeypatch):
+    """Minimal Zephyr tree standing in for ZEPHYR_BASE"""
+    base = tmp_path / "zephyr"
+    for path, text in [("Kconfig", "source \"kernel/Kconfig\"\n"),
+                       ("kernel/Kconfig", "config MUTEX\n\tbool\n"),
+                       ("kernel/mutex.c", "int mutex;\n"),
+                       ("include/kernel.h", "void k_yield(void);\n"),
+                       ("dts/common/common.dts", "/ { };\n"),
+                       ("scripts/kconfig/kconfig.py", "# kconfig\n"),
+                       ("scripts/dts/extract.py", "# dts\n"),
+                       ("scripts/sanity_chk/harness.py", "# harness\n")]:
+        (base / path).parent.mkdir(parents=True, exist_ok=True)
+        (base / path).write_text(text)
+    monkeypatch.setattr(sc, "ZEPHYR_BASE", str(base))
+    return base
+
+
+@pytest.fixture
+def inputs(sc, tree):
+    return sc.BuildInputs()
+
+
+def make_instance(tmp_path, name="test", platform="plat"):
+    test_path = tmp_path / "src" / name
+    board = tmp_path / "boards" / platform
+    for d in [test_path, board]:
+        d.mkdir(parents=True, exist_ok=True)
+    (test_path / "main.c").write_text("int main(void) { return 0; }\n")
+    (board / "board.yaml").write_text("identifier: %s\n" % platform)
+    test = types.SimpleNamespace(test_path=str(test_path), extra_args=[],
+                                 extra_configs=[], harness="",
+                                 harness_config={}, cases=["a", "b"],
+                                 timeout=60)
+    platform = types.SimpleNamespace(name=platform,
+                                     cfile=str(board / "board.yaml"))
+    outdir = tmp_path / "out" / name
+    outdir.mkdir(parents=True, exist_ok=True)
+    return types.SimpleNamespace(test=test, platform=platform,
+                                 outdir=str(outdir), results={})
+
+
+def test_build_inputs_key(sc, inputs, tree, tmp_path):
+    i = make_instance(tmp_path)
+    key = inputs.key(i.test, i.platform, ["x"])
+    assert key == inputs.key(i.test, i.platform, ["x"])
+    assert key != inputs.key(i.test, i.platform, ["y"])
+
+    other = make_instance(tmp_path, platform="other")
+    assert key != inputs.key(i.test, other.platform, ["x"])
+
+    # A new BuildInputs sees the change in the sources of the test, but
+    # not in the rest of the tree
+    (tree / "kernel" / "mutex.c").write_text("int changed;\n")
+    assert key == sc.BuildInputs().key(i.test, i.platform, ["x"])
+    (tmp_path / "src" / "test" / "main.c").write_text("int main;\n")
+    assert key != sc.BuildInputs().key(i.test, i.platform, ["x"])
+
+
+def test_build_inputs_key_covers_toolchain(inputs, tmp_path, monkeypatch):
+    i = make_instance(tmp_path)
+    monkeypatch.setenv("ZEPHYR_TOOLCHAIN_VARIANT", "zephyr")
+    key = inputs.key(i.test, i.platform, [])
+    monkeypatch.setenv("ZEPHYR_TOOLCHAIN_VARIANT", "gnuarmemb")
+    inputs.digests.clear()
+    assert key != inputs.key(i.test, i.platform, [])
+
+
+def test_build_inputs_digests(sc, tree):
+    digests = {}
+    for name in ["kconfig", "dts", "scripts"]:
+        digests[name] = getattr(sc.BuildInputs(), name + "_digest")()
+    for name, path in [("kconfig", "kernel/Kconfig"),
+                       ("dts", "dts/common/common.dts"),
+                       ("scripts", "scripts/sanity_chk/harness.py")]:
+        (tree / path).write_text("changed\n")
+        assert getattr(sc.BuildInputs(), name + "_digest")() != \
+            digests[name]
+    # Not a Kconfig file, covered by the dependencies of the builds
+    kconfig = sc.BuildInputs().kconfig_digest()
+    (tree / "kernel" / "mutex.c").write_text("changed\n")
+    assert sc.BuildInputs().kconfig_digest() == kconfig
+
+
+def write_build(outdir):
+    os.makedirs(os.path.join(outdir, "zephyr"), exist_ok=True)
+    for fn, data in [("build.log", "built\n"),
+                     ("zephyr/zephyr.elf", "\x7fELF"),
+                     ("zephyr/.config", "CONFIG_X=y\n"),
+                     ("zephyr/main.c.obj", "not cached")]:
+        with open(os.path.join(outdir, fn), "w") as f:
+            f.write(data)
+
+
+def test_build_cache_round_trip(sc, parse_args, inputs, tmp_path):
+    cache = sc.BuildCache(str(tmp_path / "cache"), inputs)
+    built = make_instance(tmp_path)
+    key = cache.key(built, [])
+    assert key != cache.key(built, ["CONF_FILE=x.conf"])
+    parse_args(["--ninja"])
+    assert key != cache.key(built, [])
+    parse_args([])
+
+    write_build(built.outdir)
+    deps = {"kernel/mutex.c", "include/kernel.h"}
+    assert not cache.restore(key, built.outdir)
+    cache.store(key, built.outdir, deps)
+    assert cache.stored == 1
+
+    restored = str(tmp_path / "restored")
+    assert cache.restore(key, restored)
+    assert cache.hits == 1
+    with open(os.path.join(restored, "zephyr", "zephyr.elf")) as f:
+        assert f.read() == "\x7fELF"
+    with open(os.path.join(restored, "zephyr", ".config")) as f:
+        assert f.read() == "CONFIG_X=y\n"
+    assert not os.path.exists(os.path.join(restored, "zephyr",
+                                           "main.c.obj"))
+
+
+def test_build_cache_checks_dependencies(sc, tree, tmp_path):
+    cache = sc.BuildCache(str(tmp_path / "cache"), sc.BuildInputs())
+    built = make_instance(tmp_path)
+    key = cache.key(built, [])
+    write_build(built.outdir)
+    cache.store(key, built.outdir, {"kernel/mutex.c"})
+    # Without dependency data, a build can't be checked
+    cache.store("other", built.outdir, set())
+    assert not cache.restore("other", str(tmp_path / "restored"))
+
+    # A change to a file the build didn't read keeps it valid
+    (tree / "include" / "kernel.h").write_text("changed\n")
+    cache = sc.BuildCache(str(tmp_path / "cache"), sc.BuildInputs())
+    assert cache.restore(key, str(tmp_path / "restored"))
+
+    (tree / "kernel" / "mutex.c").write_text("changed\n")
+    cache = sc.BuildCache(str(tmp_path / "cache"), sc.BuildInputs())
+    assert not cache.restore(key, str(tmp_path / "restored"))
+
+    # The new build is stored next to the old one
+    cache.store(key, built.outdir, {"kernel/mutex.c"})
+    assert cache.restore(key, str(tmp_path / "restored"))
+    assert len(os.listdir(cache._entry(key))) == 2
+
+
+def test_config_cache_round_trip(sc, inputs, tmp_path):
+    i = make_instance(tmp_path)
+    cache = sc.ConfigCache(str(tmp_path / "cache"), inputs)
+    key = cache.key(i.test, i.platform, ["BOARD=plat"])
+    assert key != cache.key(i.test, i.platform, ["BOARD=other"])
+    i.test.extra_configs = ["CONFIG_X=n"]
+    assert key != cache.key(i.test, i.platform, ["BOARD=plat"])
+    i.test.extra_configs = []
+    assert cache.restore(key) is None
+
+    cache.store(key, {"CONFIG_X": "y"}, {"DT_FLASH_SIZE": "64"})
+    cache.save()
+    assert cache.stored == 1
+
+    # Entries saved by concurrent runs are merged, not overwritten
+    other = sc.ConfigCache(str(tmp_path / "cache"), inputs)
+    other.store("other", {}, {})
+    other.save()
+
+    cache = sc.ConfigCache(str(tmp_path / "cache"), inputs)
+    assert cache.restore(key) == ({"CONFIG_X": "y"}, {"DT_FLASH_SIZE": "64"})
+    assert cache.restore("other") == ({}, {})
+    assert cache.hits == 2
+
+
+def test_config_cache_key(sc, tree, tmp_path):
+    i = make_instance(tmp_path)
+    key = sc.ConfigCache(str(tmp_path / "cache"), sc.BuildInputs()).key(
+        i.test, i.platform, [])
+
+    def changed():
+        cache = sc.ConfigCache(str(tmp_path / "cache"), sc.BuildInputs())
+        return cache.key(i.test, i.platform, []) != key
+
+    # Sources outside of the test don't change the configuration
+    (tree / "kernel" / "mutex.c").write_text("changed\n")
+    assert not changed()
+    (tree / "kernel" / "Kconfig").write_text("config MUTEX\n\tdef_bool y\n")
+    assert changed()
+    key = sc.ConfigCache(str(tmp_path / "cache"), sc.BuildInputs()).key(
+        i.test, i.platform, [])
+    (tmp_path / "src" / "test" / "prj.conf").write_text("CONFIG_MUTEX=y\n")
+    assert changed()
+
+
+def test_run_cache_round_trip(sc, tmp_path):
+    i = make_instance(tmp_path)
+    handler = types.SimpleNamespace(instance=i)
+    binary = tmp_path / "zephyr.exe"
+    binary.write_bytes(b"binary")
+
+    cache = sc.RunCache(str(tmp_path / "cache"))
+    assert cache.key(str(tmp_path / "missing"), handler) is None
+    key = cache.key(str(binary), handler)
+    assert cache.lookup(key) is None
+
+    cache.store(key, 1.5, {"a": "PASS", "b": "PASS"})
+    cache = sc.RunCache(str(tmp_path / "cache"))
+    assert cache.lookup(key) == {"handler_time": 1.5,
+                                 "results": {"a": "PASS", "b": "PASS"}}
+
+    binary.write_bytes(b"rebuilt binary")
+    assert cache.key(str(binary), handler) != key
+    i.test.timeout = 120
+    binary.write_bytes(b"binary")
+    assert cache.key(str(binary), handler) != key
+
+
+def test_state_kept_outside_tree(sc, tmp_path):
+    assert not sc.STATE_DIR.startswith(sc.ZEPHYR_BASE + os.sep)
+
+    # The state directory is created on the first save
+    stats = sc.FlakeStats(str(tmp_path / "state" / "flakes.csv"))
+    stats.save()
+    assert os.path.exists(tmp_path / "state" / "flakes.csv")
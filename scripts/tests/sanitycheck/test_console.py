@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Tests of the console output reading in sanity_chk/console.py
+
+import os
+import threading
+
+from sanity_chk import console
+
+
+def read_all(data, chunk_size=4096):
+    r, w = os.pipe()
+    os.write(w, data)
+    os.close(w)
+    reader = console.LineReader(r, chunk_size=chunk_size)
+    lines = []
+    while not reader.state:
+        lines += reader.read()
+    os.close(r)
+    return lines, reader.state
+
+
+def test_lines_split_across_reads():
+    lines, state = read_all("ab\nµs\ncd\n".encode(), chunk_size=3)
+    assert lines == ["ab\n", "µs\n", "cd\n"]
+    assert state == "unexpected eof"
+
+
+def test_unterminated_last_line_returned_at_eof():
+    lines, state = read_all(b"first\nPROJECT EXECUTION SUCCESSFUL")
+    assert lines == ["first\n", "PROJECT EXECUTION SUCCESSFUL"]
+    assert state == "unexpected eof"
+
+
+def test_truncated_character_dropped_at_eof():
+    lines, _ = read_all(b"tail \xc2")
+    assert lines == ["tail "]
+
+
+def test_loop_survives_callback_errors():
+    loop = console.ConsoleLoop()
+    done = {}
+    events = {name: threading.Event() for name in ["lines", "done", "good"]}
+
+    def on_done(name):
+        def cb(reason):
+            done[name] = reason
+            events[name].set()
+            if name == "done":
+                raise RuntimeError("on_done")
+        return cb
+
+    def bad_lines(lines):
+        raise RuntimeError("on_lines")
+
+    pipes = {}
+    for name, on_lines in [("lines", bad_lines),
+                           ("done", lambda lines: True),
+                           ("good", lambda lines: True)]:
+        r, w = os.pipe()
+        pipes[name] = (r, w)
+        loop.add(r, on_lines, on_done(name), timeout=10)
+
+    os.write(pipes["lines"][1], b"x\n")
+    os.write(pipes["done"][1], b"x\n")
+    assert events["lines"].wait(5) and events["done"].wait(5)
+    # The loop thread is still serving the remaining watch
+    os.write(pipes["good"][1], b"x\n")
+    assert events["good"].wait(5)
+    assert done == {"lines": "callback error", "done": "done", "good": "done"}
+
+    for r, w in pipes.values():
+        os.close(r)
+        os.close(w)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Tests of the distribution of test instances to sanitycheck --worker
+# processes
+
+import json
+import socket
+import threading
+import time
+import types
+
+import pytest
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+class FakeWorker:
+    def __init__(self, address):
+        self.sock = socket.create_connection(address)
+        self.rfile = self.sock.makefile("r", encoding="utf-8")
+        self.settings = self.receive()
+
+    def send(self, message):
+        self.sock.sendall((json.dumps(message) + "\n").encode())
+
+    def receive(self):
+        return json.loads(self.rfile.readline())
+
+    def get(self):
+        self.send({"get": True})
+        return self.receive()
+
+    def finish(self, name):
+        self.send({"result": {"name": name, "state": "finished",
+                              "failed": False, "reason": None,
+                              "metrics": {}, "results": {}}})
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+@pytest.fixture
+def coordinator(sc, parse_args, tmp_path):
+    parse_args(["-x", "FOO=1", "--ninja", "--enable-slow"])
+    instances = {}
+    goals = {}
+    for n, name in enumerate(["plat/long", "plat/short"]):
+        instances[name] = types.SimpleNamespace(
+            test=types.SimpleNamespace(name=name.split("/")[1]),
+            platform=types.SimpleNamespace(name="plat"),
+            build_only=False, outdir=str(tmp_path), results={})
+        goals[name] = sc.MakeGoal(name, None, None, None, None, None)
+        goals[name].expected_time = 10 - n
+    coordinator = sc.Coordinator("127.0.0.1:0", instances, goals)
+
+    reported = []
+    thread = threading.Thread(
+        target=coordinator.execute,
+        args=(lambda context, goals, goal: reported.append(goal.name),))
+    thread.start()
+    coordinator.reported = reported
+    coordinator.thread = thread
+    yield coordinator
+    thread.join(10)
+    assert not thread.is_alive()
+
+
+def test_options_sent_to_workers(coordinator):
+    worker = FakeWorker(coordinator.server.server_address)
+    options = worker.settings["options"]
+    assert options["extra_args"] == ["FOO=1"]
+    assert options["ninja"] and options["enable_slow"]
+    assert not options["build_only"]
+
+    for _ in range(2):
+        worker.finish("plat/" + worker.get()["instance"]["test"])
+    assert worker.get() == {"done": True}
+    worker.close()
+
+
+def test_instances_of_lost_worker_requeued(coordinator):
+    lost = FakeWorker(coordinator.server.server_address)
+    assert lost.get()["instance"]["test"] == "long"
+    lost.close()
+    wait_for(lambda: not coordinator.workers)
+
+    worker = FakeWorker(coordinator.server.server_address)
+    names = [worker.get()["instance"]["test"] for _ in range(2)]
+    assert sorted(names) == ["long", "short"]
+    for name in names:
+        worker.finish("plat/" + name)
+    worker.close()
+
+    coordinator.thread.join(10)
+    assert sorted(coordinator.reported) == ["plat/long", "plat/short"]
+    assert not any(goal.failed for goal in coordinator.goals.values())
+
+
+def test_remaining_instances_fail_without_workers(sc, coordinator,
+                                                  monkeypatch):
+    monkeypatch.setattr(sc.Coordinator, "worker_timeout", 0.5)
+    worker = FakeWorker(coordinator.server.server_address)
+    worker.finish("plat/" + worker.get()["instance"]["test"])
+    worker.close()
+
+    coordinator.thread.join(10)
+    assert coordinator.reported == ["plat/long", "plat/short"]
+    assert not coordinator.goals["plat/long"].failed
+    assert coordinator.goals["plat/short"].reason == "worker_lost"
+
+
+def test_silent_worker_considered_lost(sc, coordinator, monkeypatch):
+    monkeypatch.setattr(sc.Coordinator, "worker_timeout", 0.5)
+    worker = FakeWorker(coordinator.server.server_address)
+    worker.get()
+
+    coordinator.thread.join(10)
+    worker.close()
+    assert sorted(coordinator.reported) == ["plat/long", "plat/short"]
+    assert all(goal.reason == "worker_lost"
+               for goal in coordinator.goals.values())
+
+
+def serve_worker(options):
+    """Coordinator handing out the given options and no instances"""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def serve():
+        conn, _ = server.accept()
+        with conn, conn.makefile("r", encoding="utf-8") as rfile:
+            conn.sendall((json.dumps({"options": options}) + "\n").encode())
+            for line in rfile:
+                if json.loads(line).get("get"):
+                    conn.sendall(b'{"done": true}\n')
+        server.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return "127.0.0.1:%d" % server.getsockname()[1]
+
+
+def test_worker_quotes_extra_args(sc, parse_args, tmp_path):
+    parse_args([])
+    ts = types.SimpleNamespace(platforms=[], testcases={}, instances={},
+                               outdir=str(tmp_path))
+    address = serve_worker({"extra_args": ["FOO=a b;touch x"]})
+    assert sc.run_worker(address, ts, lambda *args: None) == {}
+    assert sc.options.extra_args == ["'FOO=a b;touch x'"]
+
+    address = serve_worker({"extra_args": ["$(touch x)"]})
+    with pytest.raises(sc.SanityRuntimeError):
+        sc.run_worker(address, ts, lambda *args: None)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Tests of the filter expressions in sanity_chk/expr_parser.py
+
+from sanity_chk import expr_parser
+
+
+def test_compiled_expressions():
+    env = expr_parser.LayeredEnv({"CONFIG_SRAM_SIZE": "0x10000"},
+                                 {"ARCH": "arm", "CONFIG_SOC": "nrf52832"})
+    for expr, result in [
+            ('ARCH == "arm" and not CONFIG_X', True),
+            ('CONFIG_SRAM_SIZE >= 32 and CONFIG_SOC : "nrf52.*"', True),
+            ('ARCH in ["x86", "riscv32"] or CONFIG_SRAM_SIZE < 16', False),
+            ('CONFIG_X != "y"', True)]:
+        assert expr_parser.parse(expr, env) == result
+
+
+def test_expressions_parsed_once():
+    expr_parser.compile_expr.cache_clear()
+    func = expr_parser.compile_expr("CONFIG_GPIO")
+    assert expr_parser.compile_expr("CONFIG_GPIO") is func
+    assert expr_parser.compile_expr.cache_info().hits == 1
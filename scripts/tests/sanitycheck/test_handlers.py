@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Tests of the handlers running test binaries
+
+import os
+import threading
+import time
+import types
+
+
+class BrokenHarness:
+    """Harness failing on the first output line"""
+    state = None
+    tests = {}
+
+    def configure(self, instance):
+        pass
+
+    def handle_many(self, lines):
+        raise ValueError("broken harness")
+
+
+class DoneHarness:
+    """Harness passing once the board prints DONE"""
+
+    def configure(self, instance):
+        self.state = None
+        self.tests = {}
+
+    def handle_many(self, lines):
+        for n, line in enumerate(lines):
+            if line == "DONE":
+                self.state = "passed"
+                return n + 1
+        return len(lines)
+
+
+def make_instance(tmp_path, script, timeout=30):
+    binary = tmp_path / "zephyr.exe"
+    binary.write_text("#!/bin/sh\n" + script)
+    binary.chmod(0o755)
+    test = types.SimpleNamespace(harness="", timeout=timeout, cases=["a"],
+                                 test_path=str(tmp_path))
+    instance = types.SimpleNamespace(name="test", test=test,
+                                     outdir=str(tmp_path), results={})
+    return instance, str(binary)
+
+
+def test_binary_handler_stops_process_after_callback_error(sc, tmp_path,
+                                                           monkeypatch):
+    monkeypatch.setattr(sc, "HarnessImporter", lambda name:
+                        types.SimpleNamespace(instance=BrokenHarness()))
+    # Ignores SIGTERM, so it has to be killed
+    instance, binary = make_instance(
+        tmp_path, "trap '' TERM\necho started\nwhile :; do sleep 1; done\n")
+    handler = sc.BinaryHandler(instance)
+    handler.binary = binary
+
+    start = time.time()
+    handler.handle()
+    assert time.time() - start < 10
+    assert handler.terminated
+    assert handler.get_state()[0] == "callback error"
+
+
+class FakeBoard:
+    """Board whose console is a pty, printing DONE some time after it's
+    flashed"""
+
+    def __init__(self, tmp_path, name, runs):
+        self.master, slave = os.openpty()
+        self.device = {"id": name, "platform": "plat",
+                       "serial": os.ttyname(slave)}
+        self.slave = slave
+        self.fifo = str(tmp_path / name)
+        os.mkfifo(self.fifo)
+        self.runs = runs
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def flash_command(self):
+        return ["/bin/sh", "-c", "echo flashed > " + self.fifo]
+
+    def serve(self):
+        while True:
+            with open(self.fifo) as f:
+                if not f.read():
+                    return
+            start = time.time()
+            time.sleep(0.3)
+            os.write(self.master, b"booting\r\nDONE\r\n")
+            self.runs.append((self.device["id"], start, time.time()))
+
+    def close(self):
+        with open(self.fifo, "w"):
+            pass
+        self.thread.join(5)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def test_device_handlers_share_boards(sc, parse_args, tmp_path,
+                                      monkeypatch):
+    parse_args([])
+    monkeypatch.setattr(sc, "HarnessImporter", lambda name:
+                        types.SimpleNamespace(instance=DoneHarness()))
+    runs = []
+    boards = [FakeBoard(tmp_path, name, runs) for name in ["b1", "b2"]]
+
+    class CheckedMap(sc.HardwareMap):
+        """Records which boards are in use"""
+        busy = set()
+        most_busy = 0
+
+        def acquire(self, platform):
+            device = super().acquire(platform)
+            with self.cond:
+                assert device["id"] not in self.busy
+                self.busy.add(device["id"])
+                CheckedMap.most_busy = max(self.most_busy, len(self.busy))
+            return device
+
+        def release(self, device):
+            with self.cond:
+                self.busy.remove(device["id"])
+            super().release(device)
+
+    hardware_map = CheckedMap([b.device for b in boards])
+    monkeypatch.setattr(sc, "hardware_map", hardware_map)
+    assert hardware_map.count("plat") == 2
+
+    # Each handler flashes the board it was given
+    flash = {b.device["serial"]: b.flash_command() for b in boards}
+    monkeypatch.setattr(sc.DeviceHandler, "get_flash_command",
+                        lambda self, device: flash[device["serial"]])
+
+    handlers = []
+    for n in range(4):
+        outdir = tmp_path / ("test%d" % n)
+        outdir.mkdir()
+        instance, _ = make_instance(outdir, "", timeout=10)
+        instance.platform = types.SimpleNamespace(name="plat")
+        handlers.append(sc.DeviceHandler(instance))
+    threads = [threading.Thread(target=h.handle) for h in handlers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+    for b in boards:
+        b.close()
+
+    assert [h.get_state()[0] for h in handlers] == ["passed"] * 4
+    # Both boards were used at the same time, and all were given back
+    assert len(runs) == 4
+    assert set(board for board, _, _ in runs) == {"b1", "b2"}
+    assert hardware_map.most_busy == 2
+    assert not hardware_map.busy
+    assert len(hardware_map.free["plat"]) == 2
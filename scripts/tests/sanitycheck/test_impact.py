@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Tests of the index of the files each test instance is built from
+
+import os
+import types
+
+
+def fake_build(sc, outdir, sources, cmake_inputs=[]):
+    """Build directory of the Makefile generator, with the depfile of
+    the compilation of sources"""
+    base = sc.ZEPHYR_BASE
+    obj = os.path.join(outdir, "zephyr", "CMakeFiles", "zephyr.dir")
+    os.makedirs(obj)
+    with open(os.path.join(obj, "main.c.obj.d"), "w") as f:
+        f.write("main.c.obj: %s \\\n %s/zephyr/include/generated/autoconf.h\n"
+                % (" \\\n ".join(os.path.join(base, s) for s in sources),
+                   outdir))
+    os.makedirs(os.path.join(outdir, "CMakeFiles"))
+    with open(os.path.join(outdir, "CMakeFiles", "Makefile.cmake"), "w") as f:
+        f.write("set(CMAKE_MAKEFILE_DEPENDS\n")
+        for path in cmake_inputs:
+            f.write('  "%s"\n' % os.path.join(base, path))
+        f.write('  "/usr/share/cmake/Modules/CMakeCInformation.cmake"\n)\n')
+
+
+def goal(name, restored=False, failed=None):
+    return types.SimpleNamespace(name=name, restored=restored,
+                                 make_state="finished", failed=bool(failed),
+                                 reason=failed)
+
+
+def test_dependencies_of_make_build(sc, tmp_path):
+    outdir = str(tmp_path / "build")
+    fake_build(sc, outdir, ["kernel/mutex.c", "include/kernel.h"],
+               ["boards/x86/qemu_x86/board.cmake"])
+    assert sc.ImpactIndex.dependencies(outdir) == {
+        "kernel/mutex.c", "include/kernel.h",
+        "boards/x86/qemu_x86/board.cmake"}
+
+
+def test_update_and_affected(sc, tmp_path):
+    instances = {}
+    for name, sources in [("plat/mutex", ["kernel/mutex.c",
+                                          "include/kernel.h"]),
+                          ("plat/sem", ["kernel/sem.c", "include/kernel.h"])]:
+        outdir = str(tmp_path / name)
+        fake_build(sc, outdir, sources)
+        instances[name] = types.SimpleNamespace(outdir=outdir)
+
+    index = sc.ImpactIndex(str(tmp_path / "impact.db"))
+    assert index.update(instances, {name: goal(name)
+                                    for name in instances}) == 2
+    assert index.indexed() == {"plat/mutex", "plat/sem"}
+    assert index.affected(["kernel/sem.c"]) == {"plat/sem"}
+    assert index.affected(["include/kernel.h"]) == {"plat/mutex",
+                                                    "plat/sem"}
+    assert index.affected(["README.rst"]) == set()
+
+    # Builds that failed or were restored from the cache keep their record
+    os.rename(instances["plat/sem"].outdir, str(tmp_path / "gone"))
+    fake_build(sc, instances["plat/sem"].outdir, ["kernel/other.c"])
+    assert index.update(instances, {
+        "plat/mutex": goal("plat/mutex", restored=True),
+        "plat/sem": goal("plat/sem", failed="build_error")}) == 0
+    assert index.affected(["kernel/sem.c"]) == {"plat/sem"}
+
+    # A new build replaces the record
+    assert index.update(instances, {"plat/sem": goal("plat/sem")}) == 1
+    assert index.affected(["kernel/sem.c"]) == set()
+    assert index.affected(["kernel/other.c"]) == {"plat/sem"}
+    index.close()
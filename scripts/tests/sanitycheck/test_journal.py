@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Tests of the results journal behind --resume
+
+import types
+
+
+def finished_goal(sc, name, reason=None):
+    goal = sc.MakeGoal(name, None, None, None, None, None)
+    goal.make_state = "finished"
+    goal.metrics = {"build_time": 2.0, "handler_time": 0.5}
+    if reason:
+        goal.fail(reason)
+    else:
+        goal.success()
+    return goal
+
+
+def test_journal_round_trip(sc, tmp_path):
+    journal = sc.ResultsJournal(str(tmp_path / "out" / "journal.jsonl"))
+    instance = types.SimpleNamespace(results={"a": "PASS"})
+    journal.open(False)
+    journal.add(finished_goal(sc, "plat/passed"), instance)
+    journal.add(finished_goal(sc, "plat/failed", "timeout"), instance)
+    journal.close()
+
+    records = journal.load()
+    assert sorted(records) == ["plat/failed", "plat/passed"]
+
+    goal = sc.MakeGoal("plat/failed", None, None, None, None, None)
+    restored = types.SimpleNamespace(results={})
+    journal.restore(goal, restored, records["plat/failed"])
+    assert goal.finished and goal.failed
+    assert goal.reason == "timeout"
+    assert goal.metrics == {"build_time": 2.0, "handler_time": 0.5}
+    assert restored.results == {"a": "PASS"}
+
+
+def test_resume_after_partial_write(sc, tmp_path):
+    fn = tmp_path / "journal.jsonl"
+    journal = sc.ResultsJournal(str(fn))
+    instance = types.SimpleNamespace(results={})
+    journal.open(False)
+    journal.add(finished_goal(sc, "plat/first"), instance)
+    journal.close()
+    # Killed in the middle of appending a record
+    with open(str(fn), "a") as f:
+        f.write('{"name": "plat/second", "sta')
+
+    assert sorted(journal.load()) == ["plat/first"]
+
+    # The resumed run keeps the complete records and appends its own
+    journal.open(True)
+    journal.add(finished_goal(sc, "plat/second"), instance)
+    journal.close()
+    assert sorted(journal.load()) == ["plat/first", "plat/second"]
+
+    # Without --resume the journal starts over
+    journal.open(False)
+    journal.close()
+    assert journal.load() == {}
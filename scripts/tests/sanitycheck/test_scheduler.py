@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Tests of the goal scheduling in MakeGenerator
+
+import os
+
+
+def restored_goal(sc, mg, name):
+    goal = sc.MakeGoal(name, None, mg.logfile,
+                       os.path.join(mg.outdir, name, "build.log"), None, None)
+    goal.restored = True
+    mg.goals[name] = goal
+    return goal
+
+
+def test_restored_build_only_goal_reported_once(sc, tmp_path):
+    mg = sc.MakeGenerator(str(tmp_path))
+    restored_goal(sc, mg, "restored")
+
+    finished = []
+
+    def cb(context, goals, goal):
+        if goal.finished:
+            finished.append(goal.name)
+
+    results = mg.execute(cb)
+
+    assert finished == ["restored"]
+    assert results["restored"].finished
+    assert not results["restored"].failed
+    with open(mg.logfile) as f:
+        assert f.read().splitlines() == ["restored restored",
+                                         "restored passed"]
+
+
+class FakeHandler:
+    """Handler whose runs end with the given states, one per run"""
+
+    def __init__(self, states):
+        self.states = list(states)
+        self.state = None
+        self.log = None
+        self.runs = 0
+
+    def handle(self):
+        self.runs += 1
+        self.state = self.states.pop(0)
+
+    def get_state(self):
+        return self.state, {"handler_time": 0.1}
+
+    def reset(self):
+        self.state = None
+
+
+def handler_goal(sc, mg, name, states, build_ok=True):
+    outdir = os.path.join(mg.outdir, name)
+    os.makedirs(outdir)
+    goal = sc.MakeGoal(name, FakeHandler(states), mg.logfile,
+                       os.path.join(outdir, "build.log"),
+                       os.path.join(outdir, "run.log"), None)
+    goal.build_cmds = ["true", "true" if build_ok else "false"]
+    mg.goals[name] = goal
+    return goal
+
+
+def make_log(mg):
+    states = {}
+    with open(mg.logfile) as f:
+        for line in f:
+            name, state = line.rstrip("\n").split(" ", 1)
+            states.setdefault(name, []).append(state)
+    return states
+
+
+def test_event_order(sc, tmp_path):
+    mg = sc.MakeGenerator(str(tmp_path))
+    handler_goal(sc, mg, "passes", ["passed"])
+    handler_goal(sc, mg, "fails", ["failed"])
+    handler_goal(sc, mg, "broken", [], build_ok=False)
+
+    seen = []
+    results = mg.execute(lambda context, goals, goal:
+                         seen.append((goal.name, goal.finished)))
+
+    assert make_log(mg) == {
+        "passes": ["building", "running", "passed"],
+        "fails": ["building", "running", "failed (failed)"],
+        "broken": ["building", "failed (build_error)"]}
+    # Each goal is reported finished once, by its last event
+    for name in results:
+        events = [finished for n, finished in seen if n == name]
+        assert events.count(True) == 1 and events[-1]
+    assert results["broken"].reason == "build_error"
+
+
+def test_retry_failed_run(sc, parse_args, tmp_path):
+    parse_args(["--retry-failed", "2"])
+    mg = sc.MakeGenerator(str(tmp_path))
+    flaky = handler_goal(sc, mg, "flaky", ["failed", "passed"])
+    broken = handler_goal(sc, mg, "broken", ["failed"] * 3)
+
+    mg.execute()
+
+    assert not flaky.failed and flaky.retries == 1
+    assert flaky.handler.runs == 2
+    assert broken.failed and broken.retries == 2
+    assert broken.handler.runs == 3
+    assert make_log(mg)["flaky"] == ["building", "running", "retrying",
+                                     "running", "passed"]
+
+    stats = sc.FlakeStats(str(tmp_path / "flakes.csv"))
+    stats.update(mg.goals)
+    stats.save()
+    stats = sc.FlakeStats(str(tmp_path / "flakes.csv"))
+    assert stats.flakes("flaky") == 1
+    assert stats.flakes("broken") == 0
+    assert stats.stats["broken"] == [1, 1, 0]
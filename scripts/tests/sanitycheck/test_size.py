@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Tests of the binary size calculation
+
+import pytest
+
+
+def test_not_an_elf_binary(sc, tmp_path):
+    fn = tmp_path / "zephyr.elf"
+    fn.write_bytes(b"MZ\x90\x00 not an ELF")
+    with pytest.raises(sc.SanityRuntimeError, match="not an ELF binary"):
+        sc.SizeCalculator(str(fn), [])
+
+
+def test_instance_with_bad_binary(sc, tmp_path):
+    (tmp_path / "zephyr").mkdir()
+    (tmp_path / "zephyr" / "zephyr.elf").write_bytes(b"garbage")
+
+    class Instance:
+        outdir = str(tmp_path)
+        test = type("Test", (), {"extra_sections": []})
+        calculate_sizes = sc.TestInstance.calculate_sizes
+
+    with pytest.raises(sc.SanityRuntimeError):
+        sc.calc_one_elf_size(Instance())
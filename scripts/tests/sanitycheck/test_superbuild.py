@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+#
+# Tests of --ninja-superbuild
+
+import os
+import shutil
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+# Stands in for ninja: prints $FAKE_NINJA_OUTPUT if set, otherwise reports
+# all the goals of the top level build.ninja as built
+FAKE_NINJA = """\
+#!{python}
+import os, re, sys
+if "--version" in sys.argv:
+    print("1.10.2")
+    sys.exit(0)
+if os.environ.get("FAKE_NINJA_OUTPUT"):
+    with open(os.environ["FAKE_NINJA_OUTPUT"]) as f:
+        output = f.read()
+    sys.stdout.write(output)
+    sys.exit(1 if "FAILED: " in output else 0)
+top = sys.argv[sys.argv.index("-C") + 1]
+with open(os.path.join(top, "build.ninja")) as f:
+    wanted = re.search(r"^build sanitycheck: phony(.*)$", f.read(), re.M)
+for target in wanted.group(1).split():
+    print("sanitycheck: built " + target.split("-")[1])
+"""
+
+
+@pytest.fixture
+def fake_ninja(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    ninja = bindir / "ninja"
+    ninja.write_text(FAKE_NINJA.format(python=sys.executable))
+    ninja.chmod(0o755)
+    monkeypatch.setenv("PATH", "%s:%s" % (bindir, os.environ["PATH"]))
+    return str(ninja)
+
+
+@pytest.fixture
+def superbuild(sc, parse_args, tmp_path, monkeypatch):
+    parse_args(["--ninja-superbuild", "-O", str(tmp_path / "out")])
+    sc.options.ninja = True
+    monkeypatch.setattr(sc, "JOBS", 1)
+    monkeypatch.setattr(sc, "RUN_JOBS", 0)
+    return sc.MakeGenerator(sc.options.outdir)
+
+
+def add_goal(mg, name):
+    outdir = os.path.join(mg.outdir, "plat", name)
+    mg.add_build_goal(name, "/nonexistent", outdir, [], "build.log")
+    goal = mg.goals[name]
+    # Only the cmake step runs outside of the superbuild
+    goal.build_cmds[0] = "true"
+    return goal
+
+
+@pytest.mark.skipif(not shutil.which("cmake"), reason="needs cmake")
+def test_ninja_target_command(sc, parse_args, fake_ninja, tmp_path):
+    parse_args(["-O", str(tmp_path / "out")])
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "CMakeLists.txt").write_text(textwrap.dedent("""\
+        cmake_minimum_required(VERSION 3.13)
+        project(t NONE)
+        add_custom_target(flash COMMAND echo "flashing $$HOME"
+                          COMMAND ${CMAKE_COMMAND} -E echo done)
+        add_custom_target(run COMMAND echo running USES_TERMINAL)
+        add_dependencies(run flash)
+        """))
+    outdir = tmp_path / "out" / "plat" / "test dir"
+    subprocess.run(["cmake", "-G", "Ninja",
+                    "-DCMAKE_MAKE_PROGRAM=" + fake_ninja,
+                    "-DCMAKE_NINJA_OUTPUT_PATH_PREFIX=plat/test dir/",
+                    "-S", str(src), "-B", str(outdir)],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    run = sc.ninja_target_command(str(outdir), "run")
+    assert run.endswith("&& echo running")
+    assert "flashing" not in run
+
+    flash = sc.ninja_target_command(str(outdir), "flash")
+    out = subprocess.run(flash, shell=True, check=True,
+                         stdout=subprocess.PIPE, universal_newlines=True,
+                         env={"HOME": "/home/x", "PATH": os.environ["PATH"]})
+    assert out.stdout == "flashing /home/x\ndone\n"
+
+    with pytest.raises(sc.SanityRuntimeError):
+        sc.ninja_target_command(str(outdir), "debug")
+
+
+def test_failed_step_output_goes_to_its_goal(superbuild, fake_ninja,
+                                             tmp_path, monkeypatch):
+    mg = superbuild
+    for name in ["good", "bad"]:
+        add_goal(mg, name)
+    output = tmp_path / "ninja.out"
+    output.write_text(textwrap.dedent("""\
+        [1/3] Building C object plat/good/a.obj
+        warning: see plat/bad/include/x.h
+        [2/3] Building C object plat/bad/b.obj
+        FAILED: plat/bad/b.obj
+        gcc -c b.c -o plat/bad/b.obj
+        b.c:1: error: boom
+        sanitycheck: built 0
+        ninja: build stopped: subcommand failed.
+        """))
+    monkeypatch.setenv("FAKE_NINJA_OUTPUT", str(output))
+
+    goals = mg.execute()
+
+    assert not goals["good"].failed
+    assert goals["bad"].reason == "build_error"
+    with open(goals["bad"].build_log) as f:
+        log = f.read()
+    assert "FAILED: plat/bad/b.obj\n" in log
+    assert "b.c:1: error: boom\n" in log
+    assert "warning" not in log
+    with open(goals["good"].build_log) as f:
+        assert "boom" not in f.read()
+
+
+def test_goal_added_during_superbuild_gets_built(superbuild, fake_ninja):
+    mg = superbuild
+    add_goal(mg, "first")
+    added = []
+
+    def feed():
+        if added:
+            return None
+        added.append(add_goal(mg, "late"))
+        return added[0]
+
+    goals = mg.execute(feed=feed)
+
+    assert added and set(goals) == {"first", "late"}
+    assert all(goal.finished and not goal.failed
+               for goal in goals.values())
+    assert len(mg.superbuilds) == 2